@@ -4,12 +4,23 @@
 ##           AND GENERATE REPORT(S)            ##
 #################################################
 
+import io
+import numpy as np
 import pandas as pd
 from sqlalchemy.engine import Engine
-from typing import TextIO, Dict, Any
+from sqlalchemy import text
+from typing import TextIO, Dict, Any, Optional, Iterable
 import dwh_config
 from datetime import datetime
 
+
+def _read_query(sql: str, engine: Engine, params: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Runs a read-only query on the (pooled) engine; params are passed as bound parameters."""
+    if params is not None:
+        return pd.read_sql(text(sql), con=engine, params=params)
+    return pd.read_sql(sql, con=engine)
+
+
 # Helper function for better report readability (Markdown table format)
 def format_markdown_table(df: pd.DataFrame) -> str:
     """Converts a DataFrame to a clean markdown table string."""
@@ -18,31 +29,47 @@ def format_markdown_table(df: pd.DataFrame) -> str:
 
     # 1. Header and Separator (Using old format for better readability)
     
-    # Calculate column widths for consistent spacing
-    col_widths = [max(len(col), 10) for col in df.columns]
+    # Cell text per column (vectorized); fillna keeps missing values printable on pandas
+    # versions where astype(str) preserves NaN
+    str_cols = [df.iloc[:, i].astype(str).fillna('nan') for i in range(df.shape[1])]
+
+    # Calculate column widths for consistent spacing (wide enough for header and every cell)
+    col_widths = [max(len(col), int(cells.str.len().max()), 10) for col, cells in zip(df.columns, str_cols)]
     
+    # The table is written into a single buffer (no intermediate concatenated strings)
+    buf = io.StringIO()
+
     header_parts = [col.ljust(width) for col, width in zip(df.columns, col_widths)]
-    header = "| " + " | ".join(header_parts) + " |"
+    buf.write("| ")
+    buf.write(" | ".join(header_parts))
+    buf.write(" |\n")
     
     # Separator uses markdown alignment syntax
     separator_parts = [":-" + "-" * (width - 1) for width in col_widths]
-    separator = "|" + "|".join(separator_parts) + "|"
+    buf.write("|")
+    buf.write("|".join(separator_parts))
+    buf.write("|")
 
     # 2. Data Rows
-    rows = []
-    for _, row in df.iterrows():
-        row_parts = [str(item).ljust(width) for item, width in zip(row.tolist(), col_widths)]
-        row_str = "| " + " | ".join(row_parts) + " |"
-        rows.append(row_str)
+    # Built column-wise with vectorized string ops (avoids a Series per row from iterrows)
+    body = None
+    for cells, width in zip(str_cols, col_widths):
+        padded = cells.str.ljust(width)
+        body = padded if body is None else body.str.cat(padded, sep=" | ")
+    for row in body.tolist():
+        buf.write("\n| ")
+        buf.write(row)
+        buf.write(" |")
 
-    return "\n".join([header, separator] + rows)
+    return buf.getvalue()
 
 # Q1: Process Cycle Analysis
 def run_q1_process_cycles(engine: Engine, line_id: str) -> str:
     """Calculates the duration of each production cycle for a specific line."""
     
     # Query uses the pre-created view (View_Line_Process_Durations)
-    sql_query = f"""
+    # line_id is a bound parameter: no injection risk and one cached plan for any line
+    sql_query = """
     SELECT 
         start_timestamp, 
         stop_timestamp, 
@@ -50,24 +77,32 @@ def run_q1_process_cycles(engine: Engine, line_id: str) -> str:
     FROM 
         View_Line_Process_Durations 
     WHERE 
-        production_line_id = '{line_id}'
+        production_line_id = :line_id
     ORDER BY 
         start_timestamp;
     """
     
-    df = pd.read_sql(sql_query, con=engine)
+    df = _read_query(sql_query, engine, params={'line_id': line_id})
     
     # Rename columns for presentation
     df.columns = ['start_timestamp', 'stop_timestamp', 'duration']
     
-    # Format the timestamps to look cleaner in the report
-    df['start_timestamp'] = df['start_timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
-    df['stop_timestamp'] = df['stop_timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    report_section = f"--- Q1: Process Cycles for Line '{line_id}' ---\n"
+
+    # No completed cycles for this line: nothing to format (NumPy's string ops reject empty arrays)
+    if df.empty:
+        return report_section + format_markdown_table(df)
     
+    # Format the timestamps to look cleaner in the report ('YYYY-MM-DD HH:MM:SS', as dt.strftime)
+    # NumPy formats the whole column at once; unlike astype(str), it keeps the time part
+    # even when every value falls on midnight
+    for col in ('start_timestamp', 'stop_timestamp'):
+        seconds = pd.to_datetime(df[col]).to_numpy(dtype='datetime64[s]')
+        df[col] = np.char.replace(np.datetime_as_string(seconds), 'T', ' ')
     
-    df['duration'] = df['duration'].astype(str) + ' minutes'
+    # Fixed 2 decimals, whether the driver returns Decimal or float
+    df['duration'] = df['duration'].map('{:.2f} minutes'.format)
     
-    report_section = f"--- Q1: Process Cycles for Line '{line_id}' ---\n"
     report_section += format_markdown_table(df)
     
     return report_section
@@ -77,31 +112,21 @@ def run_q2_floor_time(engine: Engine) -> str:
     """Calculates total uptime and downtime for the entire production floor, providing both 
     Operational Time (Total) and Full Cycle Time (In Full Cycles)."""
     
-    # 1. Query for Operational Uptime (START/ON) and Operational Downtime (STOP)
-    operational_query = """
+    # 1. Operational Uptime (START/ON), Operational Downtime (STOP) and
+    #    Full Cycle Uptime (Total Process Cycle Time), fetched in a single round-trip
+    floor_time_query = """
     SELECT 
-        SUM(total_uptime_seconds) AS operational_uptime_seconds,
-        SUM(floor_downtime_seconds) AS operational_downtime_seconds
-    FROM 
-        View_Total_Uptime_Downtime;
+        (SELECT SUM(total_uptime_seconds) FROM View_Total_Uptime_Downtime) AS operational_uptime_seconds,
+        (SELECT SUM(floor_downtime_seconds) FROM View_Total_Uptime_Downtime) AS operational_downtime_seconds,
+        (SELECT SUM(duration_seconds) FROM View_Line_Process_Durations) AS cycle_uptime_seconds;
     """
-    df_op = pd.read_sql(operational_query, con=engine)
+    row = _read_query(floor_time_query, engine).iloc[0]
     
-    operational_uptime = round(df_op.iloc[0]['operational_uptime_seconds'] / 60.0, 3)
-    operational_downtime = round(df_op.iloc[0]['operational_downtime_seconds'] / 60.0, 3)
+    operational_uptime = round(row['operational_uptime_seconds'] / 60.0, 3)
+    operational_downtime = round(row['operational_downtime_seconds'] / 60.0, 3)
+    cycle_uptime = round(row['cycle_uptime_seconds'] / 60.0, 3)
     
-    # 2. Query for Full Cycle Uptime (Total Process Cycle Time)
-    cycle_query = """
-    SELECT 
-        SUM(duration_seconds) AS cycle_uptime_seconds
-    FROM 
-        View_Line_Process_Durations;
-    """
-    df_cycle = pd.read_sql(cycle_query, con=engine)
-    
-    cycle_uptime = round(df_cycle.iloc[0]['cycle_uptime_seconds'] / 60.0, 3)
-    
-    # 3. Assemble the final summary table
+    # 2. Assemble the final summary table
     # Downtime for 'In Full Cycles' is defined as the time between START and STOP events, 
     # which is the same as the 'Operational Downtime' calculated above.
     summary_data = [
@@ -127,8 +152,9 @@ def run_q2_floor_time(engine: Engine) -> str:
 def run_q3_top_downtime(engine: Engine, top_n: int) -> str:
     """Identifies the production line(s) with the highest total downtime."""
     
-    sql_query = f"""
-    SELECT TOP {top_n}
+    # TOP takes a bound parameter when parenthesized; int() guards the config value
+    sql_query = """
+    SELECT TOP (:top_n)
         production_line_id,         
         CAST(floor_downtime_seconds / 60.0 AS DECIMAL(10, 4)) AS downtime
     FROM 
@@ -137,7 +163,7 @@ def run_q3_top_downtime(engine: Engine, top_n: int) -> str:
         floor_downtime_seconds DESC;
     """
     
-    df = pd.read_sql(sql_query, con=engine)
+    df = _read_query(sql_query, engine, params={'top_n': int(top_n)})
     
     
     df.columns = ['production_line_id', 'downtime']
@@ -153,9 +179,23 @@ def run_q3_top_downtime(engine: Engine, top_n: int) -> str:
 
 def write_report_to_file(content: str, output_file: str):
     """Writes the generated report content to a specified file."""
+    write_report_sections_to_file([content], output_file)
+
+
+def write_report_sections_to_file(report_sections: Iterable[str], output_file: str):
+    """
+    Writes the generated report sections to a specified file, one per line.
+    Sections are written straight to the file, without first joining the full report in memory.
+    """
+    # A str is itself an iterable of str: it would silently be written one character per line
+    if isinstance(report_sections, str):
+        raise TypeError("report_sections must be an iterable of sections, not a single str (use write_report_to_file).")
     try:
         with open(output_file, 'w') as f:
-            f.write(content)
+            for i, section in enumerate(report_sections):
+                if i > 0:
+                    f.write("\n")
+                f.write(section)
         print(f"\nPipeline Execution Complete. Report saved to {output_file}")
     except Exception as e:
         print(f"!!! ERROR writing report to file {output_file}: {e}")
@@ -201,5 +241,4 @@ def generate_analytics_report(engine: Engine, output_file: str):
         raise # Re-raise the exception to be caught by main_runner
 
     # 3. Write final report
-    final_report = "\n".join(report_content)
-    write_report_to_file(final_report, output_file)
\ No newline at end of file
+    write_report_sections_to_file(report_content, output_file)
\ No newline at end of file
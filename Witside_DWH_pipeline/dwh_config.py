@@ -3,7 +3,9 @@
 ## MODULE TO SET THE PIPELINE ANALYSIS PARAMETERS (CONFIGURATION) ##
 ####################################################################
 import os
+from dataclasses import dataclass, field, fields
 from pathlib import Path
+from typing import Any, Dict, Optional
 
 
 # --- A. FILE PATHS AND DIRECTORIES ---
@@ -50,7 +52,8 @@ DB_CONFIGS = {
         'password': None,
         'trusted_connection': True,
         'encrypt': True,     # Required for some newer SQL Server configurations
-        'trust_cert': True   # Bypasses SSL certificate validation errors
+        'trust_cert': True,  # Bypasses SSL certificate validation errors
+        'packet_size': 32767 # TDS packet size in bytes (max). Fewer packets per bulk insert batch than the 4096 default
     },
     'POSTGRESQL': {
         'server': os.getenv('PG_HOST', 'localhost'),
@@ -61,6 +64,21 @@ DB_CONFIGS = {
     }
 }
 
+# Connection pool settings for the target DWH engine (see dwh_sql_connection.get_db_engine)
+POOL_SIZE = 20       # Connections kept open in the pool
+MAX_OVERFLOW = 30    # Extra connections allowed above POOL_SIZE under load
+POOL_TIMEOUT = 30    # Seconds to wait for a free connection before raising
+POOL_RECYCLE = 1500  # Seconds after which a pooled connection is replaced.
+                     # Kept under the typical 30 min cloud firewall idle timeout, which silently kills connections
+POOL_WARMUP = 3      # Connections opened in parallel when the engine is created (0 disables)
+
+# Per-statement query timeout in seconds for SQL Server connections (0 = wait indefinitely).
+# Disabled by default: DDL, CREATE DATABASE and full-file MERGE/INSERT loads can legitimately run long.
+QUERY_TIMEOUT = 0
+
+# Rows per statement when SQLAlchemy batches an executemany() INSERT into multi-row VALUES ("insertmanyvalues")
+INSERTMANYVALUES_PAGE_SIZE = 1000
+
 # --- D. ETL SETTINGS ---
 
 # Normalization map: Map csv status string to integer status_id
@@ -72,6 +90,12 @@ STATUS_MAP = {
     'STOP': 3
 }
 
+# Number of CSV rows read, transformed and loaded per chunk (bounds memory use for large input files)
+CSV_CHUNK_SIZE = 200_000
+
+# Chunk size in bytes when PyArrow is installed (its streaming CSV reader splits by bytes, not rows)
+CSV_ARROW_BLOCK_SIZE = 16 * 1024 * 1024
+
 
 # --- E. ANALYTICS PARAMETERS ---
 
@@ -80,10 +104,51 @@ TOP_LINES_Q3 = 1
 
 # --- F. HELPERS ---
 
-def get_active_credentials():
-    """Returns the credentials dictionary for the currently selected DB_TYPE."""
+@dataclass(frozen=True)
+class DbCreds:
+    """
+    Validated, immutable connection settings for one DB_TYPE (parsed once from its DB_CONFIGS entry).
+    Frozen, so it is hashable and used directly as the engine/URL cache key.
+    """
+    server: Optional[str] = None
+    database: Optional[str] = None
+    driver: Optional[str] = None
+    port: Optional[int] = None
+    username: Optional[str] = None
+    password: Optional[str] = field(default=None, repr=False) # Never shown when credentials are logged
+    trusted_connection: bool = False
+    encrypt: bool = False
+    trust_cert: bool = False
+    packet_size: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, config: Dict[str, Any]) -> 'DbCreds':
+        """Builds a DbCreds from a DB_CONFIGS entry. Unknown keys raise ValueError (catches typos)."""
+        known = {f.name for f in fields(cls)}
+        unknown = set(config) - known
+        if unknown:
+            raise ValueError(f"Unknown connection setting(s) in DB_CONFIGS: {sorted(unknown)}")
+        values = dict(config)
+        # Ports may come from environment variables as strings
+        if values.get('port') is not None:
+            values['port'] = int(values['port'])
+        return cls(**values)
+
+
+# Parsed credentials per DB_TYPE, filled on first use (see get_active_credentials)
+_PARSED_CREDENTIALS: Dict[str, DbCreds] = {}
+
+
+def get_active_credentials() -> DbCreds:
+    """
+    Returns the parsed credentials for the currently selected DB_TYPE.
+    Only the active entry is parsed (once), so a mistake in an unused DB_CONFIGS block cannot break it.
+    """
     if DB_TYPE not in DB_CONFIGS:
         raise ValueError(f"DB_TYPE '{DB_TYPE}' is not defined in DB_CONFIGS.")
-    return DB_CONFIGS[DB_TYPE]
+    credentials = _PARSED_CREDENTIALS.get(DB_TYPE)
+    if credentials is None:
+        credentials = _PARSED_CREDENTIALS[DB_TYPE] = DbCreds.from_dict(DB_CONFIGS[DB_TYPE])
+    return credentials
 
 
@@ -4,14 +4,35 @@
 #################################################################
 
 import os
+import re
+from functools import lru_cache
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import ProgrammingError
 from sqlalchemy import text
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
 from dwh_sql_connection import get_db_engine
 from dwh_config import get_active_credentials, DB_TYPE, DB_NAME, SQL_DIR
 
+# SQL Server batch separator: 'GO' alone on its own line (not any 'GO' substring of the script)
+GO_SEPARATOR_RE = re.compile(r'^\s*GO\s*$', re.MULTILINE | re.IGNORECASE)
+
+
+@lru_cache(maxsize=8)
+def _load_batches(file_path: str, mtime: float, split_go: bool) -> Tuple[str, ...]:
+    """
+    Reads an SQL file and returns its non-empty batches.
+    Cached per (path, modification time), so repeated setup runs skip the file I/O and splitting
+    while an edited file is picked up again automatically.
+    """
+    with open(file_path, 'r') as f:
+        sql_script = f.read()
+
+    # Most other databases (PostgreSQL) handle the entire script as one execution block
+    commands = GO_SEPARATOR_RE.split(sql_script) if split_go else [sql_script]
+    return tuple(command.strip() for command in commands if command.strip())
+
+
 def run_sql_ddl(engine: Engine, file_path: str, print_output: bool = True):
     """
     Reads an SQL file and executes its contents against the DWH.
@@ -21,24 +42,14 @@ def run_sql_ddl(engine: Engine, file_path: str, print_output: bool = True):
         if print_output:
             print(f"-> Executing DDL script: {os.path.basename(file_path)}")
             
-        with open(file_path, 'r') as f:
-            sql_script = f.read()
-        
         # We use 'GO' in SQL Server to delineate batches/transactions.
-        if DB_TYPE == 'SQL_SERVER':
-            # Split the script into separate statements using 'GO'. 
-            commands = sql_script.split('GO')
-        else:
-            # Most other databases (PostgreSQL) handle the entire script as one execution block
-            commands = [sql_script]
+        commands = _load_batches(str(file_path), os.path.getmtime(file_path), DB_TYPE == 'SQL_SERVER')
         
         # Explicitly manage the connection and transaction for DDL to ensure 
         # tables are created and committed before they are needed by the ETL process.
         with engine.begin() as conn:
             for command in commands:
-                command = command.strip()
-                if command:
-                    conn.execute(text(command))
+                conn.execute(text(command))
         
         if print_output:
             print(f"-> Successfully executed {os.path.basename(file_path)}")
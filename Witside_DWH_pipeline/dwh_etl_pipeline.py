@@ -3,42 +3,75 @@
 ## MODULE FOR ETL PIPELINE OPERATIONS (Extract, Transform, Load) ##
 ###################################################################
 
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy import text
+from sqlalchemy.dialects.mssql import VARCHAR, TINYINT, DATETIME2
 import dwh_config # to import the parameters from config.py
 import pandas as pd
-from typing import Tuple # added to allow (unnecessary, totally optional) tuple type annotation
+import numpy as np
+from typing import Tuple, Iterator # added to allow (unnecessary, totally optional) tuple type annotation
+from contextlib import closing, ExitStack
 
+# PyArrow is optional: its multi-threaded streaming CSV reader is used for extraction when installed,
+# otherwise the pandas C parser is used (pandas' own engine='pyarrow' cannot read in chunks).
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
 
-def check_and_insert_dimension(engine: Engine, fact_df: pd.DataFrame, column_name: str, table_name: str):
+def open_csv_chunks(input_file_path: str) -> Iterator[pd.DataFrame]:
     """
-    Checks for new unique values in a dimension column and inserts them 
-    into the corresponding dimension table if they don't exist.
+    Opens the input CSV as an iterator of DataFrame chunks, with the two low-cardinality
+    string columns held as categoricals (much less memory, faster unique/lookups).
+    The file is opened eagerly, so a missing file raises FileNotFoundError here.
     """
-    unique_values = fact_df[column_name].unique()
-    
-    if unique_values.size == 0:
-        print(f"No data to check for {table_name}.")
-        return
+    if pa_csv is None:
+        return pd.read_csv(
+            input_file_path,
+            chunksize=dwh_config.CSV_CHUNK_SIZE,
+            dtype={'production_line_id': 'category', 'status': 'category'},
+            parse_dates=['timestamp']
+        )
 
-    # Create a DataFrame of the new unique values
-    new_dim_df = pd.DataFrame(unique_values, columns=[column_name])
-    
-    # Check what already exists in the dimension table
-    existing_values = pd.read_sql(f"SELECT {column_name} FROM {table_name}", con=engine)[column_name].tolist()
-    
-    # Filter for values that are not yet in the dimension table
-    to_insert_df = new_dim_df[~new_dim_df[column_name].isin(existing_values)].reset_index(drop=True)
-
-    if not to_insert_df.empty:
-        # Load new dimension keys
-        to_insert_df.to_sql(
-            name=table_name,
-            con=engine,
-            if_exists='append',
-            index=False,
-            schema='dbo' 
+    # Dictionary-encoded columns arrive in pandas as categoricals. Timestamps stay strings here:
+    # Arrow would fail the whole block on one bad value, transform_raw_data coerces them instead.
+    # Empty (or quoted empty) cells are read as null, like the pandas reader, so they get quarantined.
+    arrow_reader = pa_csv.open_csv(
+        str(input_file_path),
+        read_options=pa_csv.ReadOptions(block_size=dwh_config.CSV_ARROW_BLOCK_SIZE),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={
+                'production_line_id': pa.dictionary(pa.int32(), pa.string()),
+                'status': pa.dictionary(pa.int32(), pa.string()),
+                'timestamp': pa.string()
+            },
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True
         )
-        print(f"Successfully inserted {len(to_insert_df)} new entries into {table_name}.")
+    )
+    return (batch.to_pandas() for batch in arrow_reader)
+
+
+def check_and_insert_dimension(conn: Connection, stage_table: str, column_name: str, table_name: str):
+    """
+    Checks for new unique values in a dimension column of the staged batch and inserts them 
+    into the corresponding dimension table if they don't exist.
+    Runs as one set-based MERGE on the server (uses the dimension's unique index, nothing is downloaded).
+    Must use the connection that owns the stage temp table.
+    """
+    merge_sql = f"""
+    MERGE {table_name} AS tgt
+    USING (SELECT DISTINCT {column_name} FROM {stage_table}) AS src
+        ON tgt.{column_name} = src.{column_name}
+    WHEN NOT MATCHED THEN
+        INSERT ({column_name}) VALUES (src.{column_name});
+    """
+    inserted_rows = conn.execute(text(merge_sql)).rowcount
+
+    if inserted_rows > 0:
+        print(f"Successfully inserted {inserted_rows} new entries into {table_name}.")
     else:
         print(f"No new entries found for {table_name}.")
 
@@ -65,7 +98,19 @@ def transform_raw_data(raw_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame
     })
     
     # Map status string to ID
-    df['status_id'] = df['status_name'].map(dwh_config.STATUS_MAP)
+    # Vectorized hash lookup of each status against the STATUS_MAP keys (-1 = unmapped),
+    # instead of a per-element Python dict .map()
+    status_keys = pd.Index(list(dwh_config.STATUS_MAP.keys()))
+    status_values = np.fromiter(dwh_config.STATUS_MAP.values(), dtype='int64')
+    # The lookup runs once per distinct status (category), then is broadcast via the category codes
+    status_cat = df['status_name'].astype('category').cat
+    category_codes = status_keys.get_indexer(status_cat.categories)
+    # A trailing -1 sentinel lets missing statuses (category code -1) index to "unmapped",
+    # which also covers a chunk with no statuses at all (no categories)
+    status_codes = np.append(category_codes, -1)[status_cat.codes.to_numpy()]
+    is_mapped = status_codes >= 0
+    # Nullable integer column: unmapped statuses become <NA>
+    df['status_id'] = pd.arrays.IntegerArray(status_values[status_codes], mask=~is_mapped)
 
     # Convert timestamp to datetime (coercing errors to NaT)
     df['event_time'] = pd.to_datetime(df['event_time'], errors='coerce')
@@ -76,89 +121,189 @@ def transform_raw_data(raw_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame
     required_cols = ['production_line_id', 'status_id', 'event_time']
     
     # Check for nulls in the required columns (This catches unmapped statuses or bad dates)
-    is_valid = df[required_cols].notna().all(axis=1)
+    # Combined as plain NumPy boolean arrays, reusing the mapping result for status_id
+    is_valid = (
+        is_mapped
+        & df['event_time'].notna().to_numpy()
+        & df['production_line_id'].notna().to_numpy()
+    )
     
     # Separate clean vs dirty data
-    clean_fact_df = df[is_valid].copy()
-    quarantined_df = df[~is_valid].copy()
+    # Only the columns loaded into the DWH are taken for the clean set.
+    # The quarantine set is a plain boolean take, skipped entirely when every row is valid.
+    clean_fact_df = df.loc[is_valid, required_cols]
+    if is_valid.all():
+        quarantined_df = df.iloc[0:0]
+    else:
+        quarantined_df = df.loc[~is_valid]
     
-    # Sort data chronologically (crucial for incremental loading checks)
-    clean_fact_df.sort_values(by='event_time', inplace=True)
+    # Sort data chronologically (kept so transform_raw_data returns rows in time order; the incremental
+    # cutoff itself is applied on the server to the whole staged file, see load_staged_facts)
+    # Skipped when already in order; otherwise a stable mergesort (fast on the nearly-sorted
+    # runs typical of event logs) followed by one positional gather per column.
+    if not clean_fact_df['event_time'].is_monotonic_increasing:
+        order = np.argsort(clean_fact_df['event_time'].to_numpy(), kind='mergesort')
+        clean_fact_df = clean_fact_df.take(order)
     
     print(f"Raw rows: {len(raw_df)} | Clean rows: {len(clean_fact_df)} | Quarantined rows: {len(quarantined_df)}")
     
     return clean_fact_df, quarantined_df
 
 
+def get_latest_event_time(engine: Engine, target_table: str):
+    """
+    Returns the latest event_time already loaded into the fact table (NaT if empty or unknown).
+    """
+    max_time_query = f"SELECT MAX(event_time) FROM {target_table};"
+
+    try:
+        # Find the latest timestamp already loaded (plain scalar fetch, no DataFrame needed)
+        with engine.connect() as conn:
+            max_time_result = conn.execute(text(max_time_query)).scalar()
+        latest_event_time = pd.Timestamp(max_time_result) if max_time_result is not None else pd.NaT
+
+    except Exception as e:
+        print(f"Warning: Could not determine max event time. Proceeding with caution. Details: {e}")
+        latest_event_time = pd.NaT
+
+    return latest_event_time
+
+
+STAGE_TABLE = '#stage_events'
+
+# Stage column types match Fact_ProcessEvents (dwh_sql_schema-tables.sql), so the MERGE/INSERT compare
+# like types and fast_executemany binds fixed-size parameters (pandas would pick VARCHAR(max)/BIGINT/DATETIME)
+STAGE_DTYPES = {
+    'production_line_id': VARCHAR(10),
+    'status_id': TINYINT(),
+    'event_time': DATETIME2(precision=0),
+}
+
+
+def stage_fact_batch(conn: Connection, clean_fact_df: pd.DataFrame, create: bool) -> int:
+    """
+    Appends one batch of clean events to the session temp table STAGE_TABLE
+    (recreating it first when create is True). Returns the number of rows staged.
+    Must be called on the connection that later runs load_staged_facts: the temp table only exists within its session.
+    """
+    if clean_fact_df.empty:
+        return 0
+
+    clean_fact_df[['production_line_id', 'status_id', 'event_time']].to_sql(
+        name=STAGE_TABLE,
+        con=conn,
+        if_exists='replace' if create else 'append',
+        index=False,
+        dtype=STAGE_DTYPES,
+        chunksize=1000 # Each chunk is one executemany() batch (fast_executemany on SQL Server)
+    )
+    return len(clean_fact_df)
+
+
+def load_staged_facts(conn: Connection, target_table: str, latest_event_time) -> int:
+    """
+    Loads the staged events into the fact table, skipping events not newer than latest_event_time.
+    New production lines are added to Dim_ProductionLine first. Drops the stage table afterwards.
+    Returns the number of fact rows inserted.
+    """
+    # Incremental load is done set-based on the server: only events newer than the latest loaded one are inserted.
+    # The whole file is staged first, so its rows may be in any chronological order.
+    incremental_insert_sql = f"""
+    INSERT INTO {target_table} (production_line_id, status_id, event_time)
+    SELECT s.production_line_id, s.status_id, s.event_time
+    FROM {STAGE_TABLE} s
+    """
+    params = {}
+    if pd.notna(latest_event_time):
+        incremental_insert_sql += "WHERE s.event_time > :latest_event_time"
+        params['latest_event_time'] = latest_event_time.to_pydatetime()
+
+    # a) Load Dim_ProductionLine (before the facts referencing it)
+    check_and_insert_dimension(
+        conn,
+        STAGE_TABLE,
+        column_name='production_line_id', 
+        table_name='Dim_ProductionLine'
+    )
+
+    # b) Load Fact_ProcessEvents
+    loaded_rows = conn.execute(text(incremental_insert_sql), params).rowcount
+    conn.execute(text(f"DROP TABLE {STAGE_TABLE};"))
+
+    return loaded_rows
+
+
 def run_etl_pipeline(input_file_path: str, engine: Engine, load_data: bool):
     """
     Runs the entire ETL process (Extract, Transform, Validate, Load).
+    The input CSV is streamed in chunks (see open_csv_chunks), so memory stays bounded
+    regardless of file size: each chunk is transformed, quarantined and staged before the next is read.
+    The staged rows are then loaded in the same transaction, so a failure leaves the DWH unchanged
+    (no partially loaded file whose older rows the incremental cutoff would skip on the next run).
     """
+    TARGET_TABLE = 'Fact_ProcessEvents'
+    quarantine_file_path = dwh_config.QUARANTINE_FILE
     
     # 1. Extraction (E)
     print("\n--- Starting Data Extraction ---")
     try:
-        raw_df = pd.read_csv(input_file_path)
+        chunk_reader = open_csv_chunks(input_file_path)
     except FileNotFoundError:
         print(f"!!! ERROR: Input file not found at {input_file_path}")
         raise
-    
-    # 2. Transformation & Validation (T)
-    print("\n--- Starting Data Transformation and Validation ---")
-    clean_fact_df, quarantined_df = transform_raw_data(raw_df)
-    
-    # 3. Quarantine (If needed)
-    if not quarantined_df.empty:
-        quarantine_file_path = dwh_config.QUARANTINE_FILE 
-        quarantined_df.to_csv(quarantine_file_path, index=False)
-        print(f"Quarantined {len(quarantined_df)} invalid records to: {quarantine_file_path}")
-
-    # 4. Loading (L)
-    ###############################################
+
     if load_data:
         print("\n--- Starting Data Loading to DWH ---")
-        
-        # a) Load Dim_ProductionLine 
-        check_and_insert_dimension(
-            engine, 
-            clean_fact_df,
-            column_name='production_line_id', 
-            table_name='Dim_ProductionLine'
-        )
+        # Determined once: the incremental cutoff must not move while this run's chunks are loaded
+        latest_event_time = get_latest_event_time(engine, TARGET_TABLE)
+        if pd.isna(latest_event_time):
+            print(f"{TARGET_TABLE} is empty. Loading all clean rows.")
+        else:
+            print(f"Latest event in DB: {latest_event_time}. Loading only newer rows.")
+    else: 
+        print("\n--- Data Loading SKIPPED (load_data=False) ---")
 
-        # b) Load Fact_ProcessEvents
-        TARGET_TABLE = 'Fact_ProcessEvents'
-        max_time_query = f"SELECT MAX(event_time) FROM {TARGET_TABLE};"
+    total_quarantined = 0
+    total_staged = 0
+    total_loaded = 0
 
-        try:
-            # Find the latest timestamp already loaded
-            max_time_result = pd.read_sql(max_time_query, con=engine).iloc[0, 0]
-            latest_event_time = pd.to_datetime(max_time_result) if pd.notna(max_time_result) else pd.NaT 
+    with ExitStack() as stack:
+        stack.enter_context(closing(chunk_reader))
+        # One connection and one transaction for the whole file (the stage temp table lives in this session)
+        conn = stack.enter_context(engine.begin()) if load_data else None
 
-        except Exception as e:
-            print(f"Warning: Could not determine max event time. Proceeding with caution. Details: {e}")
-            latest_event_time = pd.NaT
+        for chunk_number, raw_df in enumerate(chunk_reader, start=1):
+            # 2. Transformation & Validation (T)
+            print(f"\n--- Transforming and Validating chunk {chunk_number} ---")
+            clean_fact_df, quarantined_df = transform_raw_data(raw_df)
 
-        # Filter the incoming data
-        if pd.isna(latest_event_time):
-            data_to_load = clean_fact_df
-            print(f"{TARGET_TABLE} is empty. Loading all {len(data_to_load)} clean rows.")
-        else:
-            data_to_load = clean_fact_df[clean_fact_df['event_time'] > latest_event_time]
-            print(f"Latest event in DB: {latest_event_time}. Found {len(data_to_load)} new rows.")
-
-        # Load filtered data
-        if not data_to_load.empty:
-            data_to_load[['production_line_id', 'status_id', 'event_time']].to_sql(
-                name=TARGET_TABLE,
-                con=engine,
-                if_exists='append',
-                index=False,
-                schema='dbo'
-            )
-            print(f"Successfully loaded {len(data_to_load)} new rows into {TARGET_TABLE}.")
+            # 3. Quarantine (If needed)
+            # The file is (re)created by the first chunk with invalid rows and appended to afterwards
+            if not quarantined_df.empty:
+                first_write = total_quarantined == 0
+                quarantined_df.to_csv(
+                    quarantine_file_path,
+                    mode='w' if first_write else 'a',
+                    header=first_write,
+                    index=False
+                )
+                total_quarantined += len(quarantined_df)
+
+            # 4. Staging (first half of L)
+            if load_data:
+                total_staged += stage_fact_batch(conn, clean_fact_df, create=total_staged == 0)
+
+        # 5. Loading (L)
+        ###############################################
+        if load_data and total_staged > 0:
+            # Loads Dim_ProductionLine and Fact_ProcessEvents from the staged file
+            total_loaded = load_staged_facts(conn, TARGET_TABLE, latest_event_time)
+
+    if total_quarantined > 0:
+        print(f"Quarantined {total_quarantined} invalid records to: {quarantine_file_path}")
+
+    if load_data:
+        if total_loaded > 0:
+            print(f"Successfully loaded {total_loaded} new rows into {TARGET_TABLE}.")
         else:
             print(f"No new data found for {TARGET_TABLE} in the current batch.")
-            
-    else: 
-        print("\n--- Data Loading SKIPPED (load_data=False) ---")
\ No newline at end of file
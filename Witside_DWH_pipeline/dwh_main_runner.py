@@ -102,8 +102,8 @@ def execute_pipeline():
         sys.exit(1)
 
     finally:
-        if dwh_engine:
-            dwh_engine.dispose()
+        # Closes the pooled connections of every engine created during the run
+        dwh_sql_connection.dispose_all()
             
         end_time = time.time()
         duration = end_time - start_time
@@ -4,106 +4,206 @@
 ######################################################
 
 
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
-from typing import Dict, Any, Optional
-import urllib.parse
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, URL
+from sqlalchemy.pool import NullPool
+from typing import Dict, Any, Tuple, Union, TYPE_CHECKING
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+import re
 import os
+import threading
+import atexit
+from types import MappingProxyType
+
+if TYPE_CHECKING:
+    from dwh_config import DbCreds
+
+# pyodbc is only needed for SQL Server (PostgreSQL runs on psycopg2)
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
 
 # Base configuration (imported from the config module during runtime)
+# Loaded lazily on first use (avoids circular imports during setup) and then reused.
+_dwh_config = None
+
+
+def _cfg():
+    """Returns the dwh_config module, importing it once on first access."""
+    global _dwh_config
+    if _dwh_config is None:
+        import dwh_config as _dwh_config_mod
+        _dwh_config = _dwh_config_mod
+    return _dwh_config
+
+
+# Process-wide engine registry, keyed by (db_type, database name, database_only, credentials)
+_ENGINES: Dict[Tuple, Engine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+# Built connection URLs, keyed by (builder, credentials, database name, master).
+# Credentials rarely change at runtime, so the URL is built once per target.
+_URL_CACHE: Dict[Tuple, URL] = {}
+_URL_CACHE_LOCK = threading.Lock()
+
 
-def build_sqlserver_url(credentials: Dict[str, Any], database_name: str, master: bool) -> str:
+def _cache_url(builder):
+    """Decorator memoizing a build_*_url function in _URL_CACHE (thread-safe)."""
+    @wraps(builder)
+    def cached_builder(credentials: 'DbCreds', database_name: str, master: bool) -> URL:
+        key = (builder.__name__, credentials, database_name, master)
+        with _URL_CACHE_LOCK:
+            url = _URL_CACHE.get(key)
+        if url is None:
+            url = builder(credentials, database_name, master)
+            with _URL_CACHE_LOCK:
+                _URL_CACHE[key] = url
+        return url
+    return cached_builder
+
+
+# Default ODBC options for robustness (always included), built once at import
+_BASE_MSSQL_PARAMS = MappingProxyType({
+    'Timeout': '30',
+    'Port': '1433', # Default SQL Server port
+    'MARS_Connection': 'yes', # Multiple active result sets on one connection (no forced client-side buffering)
+    'APP': 'DWH_pipeline', # Application name, shown to the DBA in sys.dm_exec_sessions / traces
+})
+
+# Characters that would break the ODBC connection string if they appeared in the driver value.
+# Anything else is accepted: installed driver names ('ODBC Driver 18 for SQL Server') as well as
+# unixODBC library paths ('/opt/microsoft/msodbcsql18/lib64/libmsodbcsql-18.x.so')
+_DRIVER_FORBIDDEN_RE = re.compile(r'[{};=]')
+
+# ODBC boolean values, indexed by bool (False -> 'no', True -> 'yes')
+_YESNO = ('no', 'yes')
+
+
+@_cache_url
+def build_sqlserver_url(credentials: 'DbCreds', database_name: str, master: bool) -> URL:
     """
     Builds the SQLAlchemy connection URL for SQL Server (MSSQL).
     Handles both standard and trusted (Windows Integrated) authentication.
+    Returns a URL object: SQLAlchemy does the percent-encoding and create_engine skips re-parsing a string.
     """
     
-    server = credentials.get('server')
-    driver = credentials.get('driver')
+    server = credentials.server
+    driver = credentials.driver
+    # Fail fast on driver names that would produce an unparseable ODBC connection string (e.g. '{', ';')
+    if not driver or not driver.strip() or _DRIVER_FORBIDDEN_RE.search(driver):
+        raise ValueError(
+            f"Invalid ODBC driver {driver!r}. Use the exact installed driver name (or driver library path) "
+            f"without braces, e.g. 'ODBC Driver 18 for SQL Server'."
+        )
     
     # Use 'master' database for operations that require higher privilege (like creating a new DB)
     db = 'master' if master else database_name
     
-    # 1. Build the ODBC parameters dictionary
+    # 1. Build the ODBC parameters dictionary (on top of the constant defaults)
     params = {
+        **_BASE_MSSQL_PARAMS,
         'driver': driver,
         'server': server,
         'database': db,
-        # Default options for robustness (always included)
-        'Timeout': 30, 
-        'Port': 1433, # Default SQL Server port
 
         # Security/Authentication settings from config
-        'Encrypt': 'yes' if credentials.get('encrypt', False) else 'no',
-        
+        'Encrypt': _YESNO[bool(credentials.encrypt)],
         
         # This tells the driver to trust the self-signed certificate, 
-        'TrustServerCertificate': 'yes' if credentials.get('trust_cert', False) else 'no',
+        'TrustServerCertificate': _YESNO[bool(credentials.trust_cert)],
     }
     
     # 2. Add Authentication Method
-    if credentials.get('trusted_connection', False):
+    if credentials.trusted_connection:
         # Trusted Connection (Windows Integrated Security)
         params['Trusted_Connection'] = 'yes'
-        auth_url = "" # No username/password in the URL path
+        username = password = None # No username/password in the URL
     else:
         # Standard SQL Login (Username/Password)
-        username = credentials.get('username')
-        password = credentials.get('password')
         # Note: We keep the username/password check simple here, 
         # relying on the caller (main_runner) to configure credentials correctly.
-        if not username or not password:
-             # This check is disabled when trusted_connection is True
-             pass 
-        
-        # URL-encode the password to handle special characters (e.g., #, @)
-        encoded_password = urllib.parse.quote_plus(password or "")
-        auth_url = f"{username or ''}:{encoded_password}@"
+        username, password = credentials.username, credentials.password
 
-    # 3. Format ODBC parameters for the URL query string
-    odbc_params = urllib.parse.urlencode(params).replace('+', '%20')
-    
-    # 4. Construct the final SQLAlchemy URL
+    # 3. Construct the final SQLAlchemy URL
+    # Special characters in the password (e.g., #, @) and ODBC params are encoded by SQLAlchemy.
     # When connecting to the 'master' database for DDL (master=True), 
     # we omit the database name from the URL path for safer execution context.
-    path_component = f"/{db}" if not master else "" 
-    
     # Format: mssql+pyodbc://<username>:<password>@<server>/<database>?<params>
-    # Note: path_component is empty when master=True
-    url = f"mssql+pyodbc://{auth_url}{server}{path_component}?{odbc_params}"
+    url = URL.create(
+        "mssql+pyodbc",
+        username=username,
+        password=password,
+        host=server,
+        database=None if master else db,
+        # URL query values must be strings
+        query={key: str(value) for key, value in params.items()}
+    )
     
     return url
 
 
-def build_postgresql_url(credentials: Dict[str, Any], database_name: str, master: bool) -> str:
+@_cache_url
+def build_postgresql_url(credentials: 'DbCreds', database_name: str, master: bool) -> URL:
     """
     Builds the SQLAlchemy connection URL for PostgreSQL.
     """
     
-    server = credentials.get('server')
-    port = credentials.get('port')
-    username = credentials.get('username')
-    password = credentials.get('password')
-    
     # Use 'postgres' database for operations that require higher privilege
     db = 'postgres' if master else database_name
-    
-    # URL-encode the password
-    encoded_password = urllib.parse.quote_plus(password)
 
     # Format: postgresql+psycopg2://<user>:<password>@<host>:<port>/<dbname>
-    url = f"postgresql+psycopg2://{username}:{encoded_password}@{server}:{port}/{db}"
+    # The password is URL-encoded by SQLAlchemy
+    url = URL.create(
+        "postgresql+psycopg2",
+        username=credentials.username,
+        password=credentials.password,
+        host=credentials.server,
+        port=credentials.port,
+        database=db
+    )
     
     return url
 
 
-def get_db_engine(db_type: str, credentials: Dict[str, Any], database_only: bool = False) -> Engine:
+# URL builder per DB_TYPE
+_BUILDERS = {
+    'SQL_SERVER': build_sqlserver_url,
+    'POSTGRESQL': build_postgresql_url,
+}
+
+
+def build_url(db_type: str, credentials: 'DbCreds', database_name: str, master: bool) -> URL:
     """
-    Creates a SQLAlchemy Engine connected to the specified DWH.
+    Builds the SQLAlchemy connection URL for the given database type.
+    If master is True, the URL targets the system database (used to create the DWH itself).
+    """
+    builder = _BUILDERS.get(db_type)
+    if builder is None:
+        raise ValueError(f"Unsupported database type: {db_type}")
+    return builder(credentials, database_name, master)
+
+
+def get_db_engine(db_type: str, credentials: Union['DbCreds', Dict[str, Any]], database_only: bool = False) -> Engine:
+    """
+    Returns a SQLAlchemy Engine connected to the specified DWH.
+    Engines are kept in a process-wide registry per (db_type, database name, database_only, credentials),
+    so repeated calls share one engine and its connection pool instead of rebuilding both every time.
+    All registered engines are disposed at interpreter exit (or explicitly via dispose_all).
+    A newly created DWH engine opens config.POOL_WARMUP connections up front (see _warm_pool).
+
+    Bulk INSERT behaviour: SQLAlchemy's "insertmanyvalues" batches executemany() INSERTs into
+    multi-row VALUES statements of config.INSERTMANYVALUES_PAGE_SIZE rows (for SQL Server the
+    batches are also kept under the 2100 bound-parameter limit). It applies to INSERTs that need
+    RETURNING (e.g. ORM bulk inserts); plain executemany() INSERTs such as DataFrame.to_sql staging
+    still go through pyodbc's fast_executemany parameter arrays (SQLAlchemy skips setinputsizes
+    for those executemany() calls; all other statements keep their typed parameter binding).
     
     Args:
         db_type (str): The type of database ('SQL_SERVER' or 'POSTGRESQL').
-        credentials (Dict): The configuration dictionary for the database type.
+        credentials (DbCreds): The parsed credentials for the database type
+                               (a raw DB_CONFIGS dictionary is also accepted and parsed).
         database_only (bool): If True, connects to the master database 
                               (e.g., 'master' for SQL Server, 'postgres' for PostgreSQL) 
                               instead of the target DWH defined by config.DB_NAME.
@@ -112,27 +212,136 @@ def get_db_engine(db_type: str, credentials: Dict[str, Any], database_only: bool
     Returns:
         Engine: The SQLAlchemy engine instance.
     """
-    # Import config dynamically to avoid circular dependencies during setup
-    import dwh_config 
-    
+    dwh_config = _cfg()
+    if isinstance(credentials, dict):
+        credentials = dwh_config.DbCreds.from_dict(credentials)
     db_name = dwh_config.DB_NAME
-    
-    if db_type == 'SQL_SERVER':
-        url = build_sqlserver_url(credentials, db_name, database_only)
-        #When performing high-level DDL (like CREATE DATABASE),
-        #the engine must be set to isolation_level='AUTOCOMMIT' to prevent 
-        # the database from raising "CREATE DATABASE statement not allowed within multi-statement transaction."
-        isolation_level = 'AUTOCOMMIT' if database_only else None #important
-    elif db_type == 'POSTGRESQL':
-        url = build_postgresql_url(credentials, db_name, database_only)
-        # PostgreSQL handles CREATE DATABASE within transactions fine, but we can set 
-        # AUTOCOMMIT for consistency if we are in the 'master' context.
-        isolation_level = 'AUTOCOMMIT' if database_only else None
-    else:
-        raise ValueError(f"Unsupported database type: {db_type}")
+    key = (db_type, db_name, database_only, credentials)
+
+    created = False
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            engine = _create_engine(db_type, db_name, database_only, credentials)
+            _ENGINES[key] = engine
+            created = True
+
+    # Warm outside the lock, so other threads can already look up engines meanwhile
+    if created and not database_only:
+        _warm_pool(engine, min(dwh_config.POOL_WARMUP, dwh_config.POOL_SIZE))
+
+    return engine
+
+
+def _warm_pool(engine: Engine, count: int):
+    """
+    Opens `count` pooled connections in parallel and returns them to the pool, so the first queries
+    do not each pay the TCP/TLS/ODBC handshake. Failures are only reported: the pool then connects
+    lazily as before, and the real error surfaces on first use.
+    """
+    if count <= 0:
+        return
+
+    # All connections are held until every one is open (returning one early would let the next
+    # checkout reuse it instead of opening a new one), then returned to the pool together
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        futures = [executor.submit(engine.connect) for _ in range(count)]
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    for future in futures:
+        if future.exception() is None:
+            future.result().close()
+    if errors:
+        print(f"-> WARNING: Connection pool warm-up failed ({len(errors)}/{count}): {errors[0]}")
+
+
+def dispose_all():
+    """
+    Disposes every registered engine (closing their pooled connections) and empties the registry.
+    Registered to run at interpreter exit; can also be called directly, e.g. for test teardown.
+    """
+    with _ENGINES_LOCK:
+        engines = list(_ENGINES.values())
+        _ENGINES.clear()
+    for engine in engines:
+        engine.dispose()
+
+
+atexit.register(dispose_all)
+
+
+# Extra create_engine arguments per DB_TYPE.
+# SQL Server: pyodbc sends executemany() as one parameter array per batch instead of one
+# round-trip per row, which dominates bulk load (to_sql) time otherwise.
+_DIALECT_KWARGS = {
+    'SQL_SERVER': MappingProxyType({'fast_executemany': True}),
+    'POSTGRESQL': MappingProxyType({}),
+}
+
+# ODBC connection attribute for the TDS packet size (SQL_ATTR_PACKET_SIZE). It is not a connection-string
+# keyword, so it is set through pyodbc's attrs_before, i.e. before the connection is opened.
+_SQL_ATTR_PACKET_SIZE = 112
+
+
+def _configure_pyodbc_connection(dbapi_conn, connection_record):
+    """
+    'connect' event handler for SQL Server engines: applies config.QUERY_TIMEOUT to each new
+    physical connection (pyodbc's default is no timeout).
+    """
+    dbapi_conn.timeout = _cfg().QUERY_TIMEOUT
+
+
+def _create_engine(db_type: str, db_name: str, database_only: bool, credentials: 'DbCreds') -> Engine:
+    """
+    Creates the SQLAlchemy Engine for get_db_engine (called once per registry key).
+    Disposing a returned engine only closes its pooled connections; it stays usable afterwards.
+    """
+    url = build_url(db_type, credentials, db_name, database_only)
+
+    # When performing high-level DDL (like CREATE DATABASE),
+    # the engine must be set to isolation_level='AUTOCOMMIT' to prevent SQL Server
+    # from raising "CREATE DATABASE statement not allowed within multi-statement transaction."
+    # PostgreSQL uses AUTOCOMMIT in the 'master' context as well, for consistency.
+    isolation_level = 'AUTOCOMMIT' if database_only else None #important
+    dialect_kwargs = dict(_DIALECT_KWARGS[db_type])
+
+    # Larger TDS packets: each executemany batch is sent in fewer network packets
+    if db_type == 'SQL_SERVER' and credentials.packet_size:
+        dialect_kwargs['connect_args'] = {'attrs_before': {_SQL_ATTR_PACKET_SIZE: int(credentials.packet_size)}}
+
+    dwh_config = _cfg()
 
-    # Use a pool size of 5 connections and allow 10 overflows
     # Apply isolation_level only when necessary
-    engine = create_engine(url, pool_size=5, max_overflow=10, isolation_level=isolation_level)
+    # pool_pre_ping checks a pooled connection before handing it out (no failures on stale connections);
+    # pool_recycle proactively replaces connections before a firewall idle timeout can drop them;
+    # pool_use_lifo hands out the most recently returned connection, so a small set of connections stays
+    # warm (statement cache, TLS session) under bursty load while idle ones age out via pool_recycle
+    if database_only:
+        # The system-database engine is used once for DB creation and then discarded: no pool
+        engine = create_engine(
+            url,
+            poolclass=NullPool,
+            pool_pre_ping=True,
+            isolation_level=isolation_level,
+            insertmanyvalues_page_size=dwh_config.INSERTMANYVALUES_PAGE_SIZE,
+            **dialect_kwargs
+        )
+    else:
+        engine = create_engine(
+            url,
+            pool_size=dwh_config.POOL_SIZE,
+            max_overflow=dwh_config.MAX_OVERFLOW,
+            pool_timeout=dwh_config.POOL_TIMEOUT,
+            pool_recycle=dwh_config.POOL_RECYCLE,
+            pool_use_lifo=True,
+            pool_reset_on_return='rollback',
+            pool_pre_ping=True,
+            isolation_level=isolation_level,
+            insertmanyvalues_page_size=dwh_config.INSERTMANYVALUES_PAGE_SIZE,
+            **dialect_kwargs
+        )
+
+    # Only registered when a timeout is configured (0 keeps pyodbc's default of no timeout)
+    if db_type == 'SQL_SERVER' and pyodbc is not None and dwh_config.QUERY_TIMEOUT > 0:
+        event.listen(engine, 'connect', _configure_pyodbc_connection)
     
     return engine
\ No newline at end of file